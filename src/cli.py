@@ -3,24 +3,26 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import sys
+from collections import Counter
 from pathlib import Path
 
 from src.models import TodoItem
-from src.storage import load_items, save_items
+from src.storage import (
+    append_item,
+    append_tombstone,
+    get_item,
+    iter_items,
+    query_items,
+    save_delta,
+)
 
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _find_item(items: list[TodoItem], item_id: str) -> TodoItem | None:
-    for item in items:
-        if item.id == item_id:
-            return item
-    return None
-
-
 def _print_table(items: list[TodoItem]) -> None:
     """Print items as an aligned plain-text table."""
     if not items:
@@ -28,35 +30,38 @@ def _print_table(items: list[TodoItem]) -> None:
         return
 
     headers = ["ID", "Title", "Category", "Done", "Created", "Updated"]
-    rows: list[list[str]] = []
-    for it in items:
-        rows.append([
-            it.id[:8],
+    widths = [len(h) for h in headers]
+    # Build the rows and measure the columns in a single pass.
+    rows: list[tuple[str, ...]] = [()] * len(items)
+    for n, it in enumerate(items):
+        row = (
+            it.id,
             it.title,
             it.category,
             "Yes" if it.done else "No",
             it.created_at[:19],
             it.updated_at[:19],
-        ])
-
-    widths = [len(h) for h in headers]
-    for row in rows:
+        )
+        rows[n] = row
         for i, cell in enumerate(row):
-            widths[i] = max(widths[i], len(cell))
+            if len(cell) > widths[i]:
+                widths[i] = len(cell)
 
     fmt = "  ".join(f"{{:<{w}}}" for w in widths)
-    print(fmt.format(*headers))
-    print(fmt.format(*["-" * w for w in widths]))
-    for row in rows:
-        print(fmt.format(*row))
+    lines = [fmt.format(*headers), fmt.format(*["-" * w for w in widths])]
+    lines.extend(fmt.format(*row) for row in rows)
+    # One write for the whole table rather than a print() per row.
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+_BOOL_MAP = {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}
 
 
 def _parse_bool(value: str) -> bool:
-    if value.lower() in ("true", "1", "yes"):
-        return True
-    if value.lower() in ("false", "0", "no"):
-        return False
-    raise argparse.ArgumentTypeError(f"Invalid boolean value: {value!r}")
+    result = _BOOL_MAP.get(value.lower())
+    if result is None:
+        raise argparse.ArgumentTypeError(f"Invalid boolean value: {value!r}")
+    return result
 
 
 # ---------------------------------------------------------------------------
@@ -64,35 +69,32 @@ def _parse_bool(value: str) -> bool:
 # ---------------------------------------------------------------------------
 
 def cmd_add(args: argparse.Namespace, db: Path | None = None) -> int:
-    items = load_items(db)
     item = TodoItem(title=args.title, category=args.category)
-    items.append(item)
-    save_items(items, db)
+    append_item(item, db)
     print(f"Added: {item.id}")
     return 0
 
 
 def cmd_update(args: argparse.Namespace, db: Path | None = None) -> int:
-    items = load_items(db)
-    item = _find_item(items, args.id)
+    item = get_item(args.id, db)
     if item is None:
         print(f"Error: item {args.id!r} not found.", file=sys.stderr)
         return 1
 
-    changed = False
+    changes: dict[str, object] = {}
     if args.title is not None:
-        item.title = args.title
-        changed = True
+        changes["title"] = args.title
     if args.category is not None:
-        item.category = args.category
-        changed = True
+        changes["category"] = args.category
     if args.done is not None:
-        item.done = args.done
-        changed = True
+        changes["done"] = args.done
 
-    if changed:
+    if changes:
+        item.apply_changes(changes)
         item.touch()
-        save_items(items, db)
+        changes["updated_at"] = item.updated_at
+        # Persist only the changed fields, not a full copy of the item.
+        save_delta(item.id, changes, db)
         print(f"Updated: {item.id}")
     else:
         print("Nothing to update.")
@@ -100,37 +102,22 @@ def cmd_update(args: argparse.Namespace, db: Path | None = None) -> int:
 
 
 def cmd_delete(args: argparse.Namespace, db: Path | None = None) -> int:
-    items = load_items(db)
-    original_len = len(items)
-    items = [it for it in items if it.id != args.id]
-    if len(items) == original_len:
+    if get_item(args.id, db) is None:
         print(f"Error: item {args.id!r} not found.", file=sys.stderr)
         return 1
-    save_items(items, db)
+    append_tombstone(args.id, db)
     print(f"Deleted: {args.id}")
     return 0
 
 
 def cmd_list(args: argparse.Namespace, db: Path | None = None) -> int:
-    items = load_items(db)
-
-    if args.category:
-        items = [it for it in items if it.category.lower() == args.category.lower()]
-    if args.done is not None:
-        items = [it for it in items if it.done == args.done]
-    if args.search:
-        term = args.search.lower()
-        items = [it for it in items if term in it.title.lower()]
-
+    items = query_items(db, category=args.category, done=args.done, search=args.search)
     _print_table(items)
     return 0
 
 
 def cmd_categories(args: argparse.Namespace, db: Path | None = None) -> int:
-    items = load_items(db)
-    counts: dict[str, int] = {}
-    for it in items:
-        counts[it.category] = counts.get(it.category, 0) + 1
+    counts = Counter(it.category for it in iter_items(db))
 
     if not counts:
         print("No categories (no items).")
@@ -146,7 +133,10 @@ def cmd_categories(args: argparse.Namespace, db: Path | None = None) -> int:
 # Parser
 # ---------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
 def build_parser() -> argparse.ArgumentParser:
+    # Cached: parsing does not mutate the parser, so every main() call in
+    # a process can share one instance.
     parser = argparse.ArgumentParser(
         prog="todo",
         description="A simple console-based to-do manager.",
@@ -160,14 +150,14 @@ def build_parser() -> argparse.ArgumentParser:
 
     # update
     p_upd = sub.add_parser("update", help="Update an existing item")
-    p_upd.add_argument("id", help="Item UUID")
+    p_upd.add_argument("id", help="Item id")
     p_upd.add_argument("--title", default=None, help="New title")
     p_upd.add_argument("--category", default=None, help="New category")
     p_upd.add_argument("--done", type=_parse_bool, default=None, help="Mark done (true/false)")
 
     # delete
     p_del = sub.add_parser("delete", help="Delete an item by id")
-    p_del.add_argument("id", help="Item UUID")
+    p_del.add_argument("id", help="Item id")
 
     # list
     p_ls = sub.add_parser("list", help="List items with optional filters")
@@ -1,45 +1,497 @@
-"""JSON-file persistence with atomic writes."""
+"""Append-only JSON-Lines persistence with atomic compaction.
+
+The database file is a log with one JSON record per line:
+
+    {"op":"put","item":{...}}   add an item, or replace it with a new revision
+    {"op":"upd","id":"...","changes":{...}}   set some fields of an item
+    {"op":"del","id":"..."}     tombstone: remove the item with that id
+
+``load_items`` replays the log in order. Single-item changes are appended
+(O(1) writes); ``save_items`` rewrites the whole file as a compact snapshot.
+Files holding a legacy JSON array are still read and get migrated on the
+first append.
+
+A ``.gz`` path stores the same log gzip-compressed; each append adds a
+gzip member, which readers concatenate transparently. An uncompressed file
+under a ``.gz`` name is still read and gets compressed on the first write.
+The level comes from ``TODO_COMPRESS_LEVEL`` (clamped to 1-9, default
+``DEFAULT_COMPRESS_LEVEL``).
+
+Paths with a SQLite suffix (see ``src.storage_sqlite``) are routed to the
+SQLite backend instead, unless the file already holds a JSON database; the
+public functions below dispatch on the path.
+"""
 
 from __future__ import annotations
 
+import functools
+import gzip
+import itertools
 import json
 import os
 import tempfile
+import zlib
+from collections.abc import Iterator
 from pathlib import Path
 
+from src import storage_sqlite
 from src.models import TodoItem
 
 DEFAULT_DB = "todo_data.json"
 
+# Rewrite the log once it holds more stale records than this (and more stale
+# records than live items), keeping compaction cost amortised O(1) per write.
+COMPACT_THRESHOLD = 100
+
+# Snapshots smaller than this are written in place (the previous file is
+# kept as ``.bak`` until the write completes) instead of through a uniquely
+# named temp file. Readers use the ``.bak`` meanwhile, but unlike the temp
+# file path this is not safe with two processes writing at once.
+SMALL_WRITE_LIMIT = 8192
+
+# Fast deflate: the log compresses well even at low levels, and the write
+# then costs less CPU than the disk I/O it saves.
+DEFAULT_COMPRESS_LEVEL = 3
+
+# Trailing bytes of a .gz log searched for its last member before an append
+# falls back to reading the whole file. Appended members hold one record.
+GZIP_TAIL_WINDOW = 65536
+
+# Module-level singletons so construction cost is paid once per process.
+# Without ``indent`` the encoder takes the C-accelerated one-shot path.
+_GZIP_MAGIC = b"\x1f\x8b"
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_DECODER = json.JSONDecoder()
+
+# Log lines decoded per call, as one JSON array: far cheaper than a decode
+# call per line, while memory stays bounded by the batch rather than the
+# file.
+_DECODE_BATCH = 1024
+
 
 def _db_path() -> Path:
     return Path(os.environ.get("TODO_DB", DEFAULT_DB))
 
 
+def is_sqlite(path: Path | None = None) -> bool:
+    """Return True if *path* (or the default database) uses the SQLite backend."""
+    p = path or _db_path()
+    if p.suffix.lower() not in storage_sqlite.SUFFIXES:
+        return False
+    # An existing file that is not SQLite (e.g. a JSON database kept as
+    # todos.db by earlier versions) stays on the log backend.
+    try:
+        with open(p, "rb") as f:
+            header = f.read(len(storage_sqlite.HEADER))
+    except FileNotFoundError:
+        return True
+    return not header or header == storage_sqlite.HEADER
+
+
+def _wants_gzip(p: Path) -> bool:
+    """Return True if writes to *p* should be gzip-compressed."""
+    return p.suffix.lower() == ".gz"
+
+
+def _is_gzip(p: Path) -> bool:
+    """Return True if *p* exists and starts with the gzip magic bytes."""
+    try:
+        with open(p, "rb") as f:
+            return f.read(2) == _GZIP_MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _compress_level() -> int:
+    raw = os.environ.get("TODO_COMPRESS_LEVEL")
+    if raw is None:
+        return DEFAULT_COMPRESS_LEVEL
+    try:
+        level = int(raw)
+    except ValueError:
+        raise ValueError(
+            f"TODO_COMPRESS_LEVEL must be an integer from 1 to 9, got {raw!r}"
+        ) from None
+    # gzip tops out at 9; clamp (e.g. a zstd-style 19) rather than fail saves.
+    return min(max(level, 1), 9)
+
+
+def _open(p: Path, mode: str):
+    """Open the log at *p* in binary *mode* ("rb" or "ab").
+
+    Reads sniff the gzip magic bytes, so a plain log under a ``.gz`` name
+    (e.g. written by an earlier version) is still readable; appends to a
+    ``.gz`` path are compressed.
+    """
+    if mode == "rb":
+        return gzip.open(p, mode) if _is_gzip(p) else open(p, mode)
+    if _wants_gzip(p):
+        return gzip.open(p, mode, compresslevel=_compress_level())
+    return open(p, mode)
+
+
+def _backup_path(p: Path) -> Path:
+    return p.with_name(p.name + ".bak")
+
+
+def _restore_backup(p: Path) -> None:
+    """Roll back a small in-place write that was interrupted.
+
+    ``save_items`` removes the ``.bak`` once the new file is fully written,
+    so a ``.bak`` that still exists marks an unfinished write: it replaces
+    whatever (possibly partial) file is at *p*. Only writers call this;
+    readers read the ``.bak`` instead (see ``_live_rows``).
+    """
+    try:
+        os.replace(_backup_path(p), p)
+    except FileNotFoundError:
+        pass
+
+
+def _encode_record(record: dict) -> bytes:
+    # json escapes control characters, so a record never spans lines.
+    return _ENCODER.encode(record).encode("utf-8") + b"\n"
+
+
+def _is_legacy(p: Path) -> bool:
+    """Return True if *p* holds a pre-log JSON array snapshot."""
+    if not p.exists():
+        return False
+    with _open(p, "rb") as f:
+        return f.read(1) == b"["
+
+
+def _row(d: dict) -> tuple[tuple, str, str]:
+    """Return the cached row for item dict *d*.
+
+    That is the ``TodoItem`` constructor arguments plus the lowercased title
+    and category, which ``query_items`` filters on without building items.
+    """
+    title, category = d["title"], d["category"]
+    fields = (title, category, d["done"], d["id"], d["created_at"], d["updated_at"])
+    return fields, title.lower(), category.lower()
+
+
+def _complete_lines(f) -> Iterator[bytes]:
+    """Yield the lines of *f*, stopping at a gzip member that was cut short.
+
+    An interrupted append to a ``.gz`` log leaves a truncated member, which
+    the gzip reader reports as EOFError (or BadGzipFile when only part of
+    the magic was written); everything before it is intact.
+    """
+    try:
+        yield from f
+    except (EOFError, gzip.BadGzipFile):
+        return
+
+
+def _iter_records(lines: Iterator[bytes]) -> Iterator[dict]:
+    """Decode the log records in *lines*, ``_DECODE_BATCH`` lines at a time."""
+    batch: list[bytes] = []
+    for line in lines:
+        if not line.endswith(b"\n"):
+            # Unterminated final record: an append that was interrupted
+            # mid-write. It never completed, so it is not part of the log.
+            break
+        if line.strip():
+            batch.append(line)
+            if len(batch) == _DECODE_BATCH:
+                yield from _DECODER.decode("[" + b",".join(batch).decode("utf-8") + "]")
+                batch.clear()
+    if batch:
+        yield from _DECODER.decode("[" + b",".join(batch).decode("utf-8") + "]")
+
+
+def _read_log(p: Path) -> tuple[dict[str, tuple], int]:
+    """Replay the log at *p*.
+
+    Returns the live items keyed by id (in insertion order) as immutable
+    rows (see ``_row``), and the number of records that no longer
+    contribute to that state. Records are replayed on the decoded dicts;
+    no ``TodoItem`` is built here.
+    """
+    live: dict[str, dict] = {}
+    records = 0
+    with _open(p, "rb") as f:
+        lines = _complete_lines(f)
+        first = next(lines, b"")
+        if first[:1] == b"[":
+            items = _DECODER.decode((first + f.read()).decode("utf-8"))
+            return {d["id"]: _row(d) for d in items}, 0
+        for rec in _iter_records(itertools.chain((first,), lines)):
+            records += 1
+            op = rec["op"]
+            if op == "put":
+                d = rec["item"]
+                live[d["id"]] = d
+            elif op == "upd":
+                d = live.get(rec["id"])
+                if d is not None:
+                    d.update(rec["changes"])
+            elif op == "del":
+                live.pop(rec["id"], None)
+            else:
+                raise ValueError(f"Unknown log record op: {op!r}")
+    return {item_id: _row(d) for item_id, d in live.items()}, records - len(live)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_log_cached(key: tuple[str, int, int, int]) -> tuple[dict[str, tuple], int]:
+    """Memoised ``_read_log`` keyed by (path, inode, mtime_ns, size).
+
+    The cached rows are immutable and every reader builds fresh items from
+    them, so a caller mutating what it received cannot change the cached
+    state.
+
+    Any change to the file changes the key, so stale entries are never hit;
+    in-process writers also clear the cache explicitly.
+    """
+    return _read_log(Path(key[0]))
+
+
+def _drop_torn_tail(p: Path) -> None:
+    """Truncate an unterminated final record left by an interrupted append."""
+    with open(p, "r+b") as f:
+        pos = f.seek(0, os.SEEK_END)
+        if pos == 0:
+            return
+        f.seek(pos - 1)
+        if f.read(1) == b"\n":
+            return
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                f.truncate(pos + newline + 1)
+                return
+        f.truncate(0)
+
+
+def _gzip_tail_is_torn(p: Path) -> bool:
+    """Return True if the last gzip member of *p* was cut short.
+
+    Scans back from the end for a gzip header whose member decompresses to
+    completion: if bytes remain after it, the append that wrote them was
+    interrupted. Without a complete member in ``GZIP_TAIL_WINDOW`` (e.g. a
+    single large snapshot) the whole file is read instead.
+    """
+    size = p.stat().st_size
+    start = max(0, size - GZIP_TAIL_WINDOW)
+    with open(p, "rb") as f:
+        f.seek(start)
+        tail = f.read()
+    pos = tail.rfind(_GZIP_MAGIC)
+    while pos != -1:
+        d = zlib.decompressobj(wbits=31)
+        try:
+            d.decompress(tail[pos:])
+        except zlib.error:
+            # Magic bytes inside compressed data, not a member header.
+            pass
+        else:
+            if d.eof:
+                return bool(d.unused_data)
+        pos = tail.rfind(_GZIP_MAGIC, 0, pos)
+    try:
+        with gzip.open(p, "rb") as f:
+            while f.read(1 << 20):
+                pass
+    except (EOFError, gzip.BadGzipFile):
+        return True
+    return False
+
+
+def _append(record: dict, path: Path | None) -> None:
+    p = path or _db_path()
+    _restore_backup(p)
+    if _is_gzip(p):
+        if _gzip_tail_is_torn(p):
+            # A member cut short would hide every member appended after
+            # it; rewrite the complete records before appending.
+            compact(p)
+    elif _is_legacy(p) or (_wants_gzip(p) and p.exists() and p.stat().st_size):
+        # Legacy array, or a plain log under a .gz name: rewrite it in the
+        # current format before appending to it.
+        compact(p)
+    elif p.exists():
+        # Otherwise the new record would be glued onto the partial line.
+        _drop_torn_tail(p)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with _open(p, "ab") as f:
+        f.write(_encode_record(record))
+    _read_log_cached.cache_clear()
+
+
+def _live_rows(p: Path) -> dict[str, tuple]:
+    """Return the cached live rows of the log at *p*, keyed by id.
+
+    A leftover ``.bak`` is the last complete snapshot and is read in place
+    of *p* without being renamed, so a reader never moves files under a
+    writer; the next write restores it.
+
+    Shared with the cache: callers must not mutate it, only build items
+    from it.
+    """
+    for src in (_backup_path(p), p):
+        try:
+            st = src.stat()
+            rows, stale = _read_log_cached((str(src), st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            # No such file, or a writer removed the .bak since the stat.
+            continue
+        if stale > COMPACT_THRESHOLD and stale > len(rows):
+            save_items([TodoItem(*row[0]) for row in rows.values()], p)
+        return rows
+    return {}
+
+
+def get_item(item_id: str, path: Path | None = None) -> TodoItem | None:
+    """Return the item with *item_id*, or None.
+
+    Looks the id up without building the whole index, so single-item
+    commands do not allocate per-item work.
+    """
+    p = path or _db_path()
+    if is_sqlite(p):
+        return storage_sqlite.get_item(item_id, p)
+    row = _live_rows(p).get(item_id)
+    return None if row is None else TodoItem(*row[0])
+
+
+def iter_items(path: Path | None = None) -> Iterator[TodoItem]:
+    """Yield all to-do items in insertion order without building a list.
+
+    SQLite databases stream rows from the cursor.
+    """
+    p = path or _db_path()
+    if is_sqlite(p):
+        return storage_sqlite.iter_items(p)
+    return (TodoItem(*row[0]) for row in _live_rows(p).values())
+
+
 def load_items(path: Path | None = None) -> list[TodoItem]:
-    """Load all to-do items from the JSON file."""
+    """Load all to-do items by replaying the log."""
+    return list(iter_items(path))
+
+
+def query_items(
+    path: Path | None = None,
+    category: str | None = None,
+    done: bool | None = None,
+    search: str | None = None,
+) -> list[TodoItem]:
+    """Return the items matching every given filter.
+
+    ``category`` is an exact, case-insensitive match; ``search`` is a
+    case-insensitive substring match on the title. SQLite databases
+    evaluate the filters in SQL.
+    """
+    p = path or _db_path()
+    if is_sqlite(p):
+        return storage_sqlite.query_items(p, category, done, search)
+
+    cat = category.lower() if category else None
+    term = search.lower() if search else None
+    if cat is None and done is None and term is None:
+        # Plain `todo list`, the common case: no predicates to apply.
+        return load_items(p)
+    # One fused pass over the cached rows, whose lowercased title and
+    # category are computed once per file version; only the matches are
+    # built into items.
+    return [
+        TodoItem(*fields)
+        for fields, title_lower, category_lower in _live_rows(p).values()
+        if (cat is None or category_lower == cat)
+        and (done is None or fields[2] == done)
+        and (term is None or term in title_lower)
+    ]
+
+
+def append_item(item: TodoItem, path: Path | None = None) -> None:
+    """Append *item* to the log, adding it or superseding an earlier revision."""
+    p = path or _db_path()
+    if is_sqlite(p):
+        storage_sqlite.append_item(item, p)
+        return
+    _append({"op": "put", "item": item.to_dict()}, p)
+
+
+def save_delta(item_id: str, changes: dict, path: Path | None = None) -> None:
+    """Append a record that sets only the *changes* fields of an item."""
+    p = path or _db_path()
+    if is_sqlite(p):
+        storage_sqlite.save_delta(item_id, changes, p)
+        return
+    _append({"op": "upd", "id": item_id, "changes": changes}, p)
+
+
+def append_tombstone(item_id: str, path: Path | None = None) -> None:
+    """Append a tombstone that removes the item with *item_id*."""
+    p = path or _db_path()
+    if is_sqlite(p):
+        storage_sqlite.append_tombstone(item_id, p)
+        return
+    _append({"op": "del", "id": item_id}, p)
+
+
+def compact(path: Path | None = None) -> None:
+    """Rewrite the log as a snapshot holding only the live items."""
     p = path or _db_path()
+    if is_sqlite(p):
+        return
+    _restore_backup(p)
     if not p.exists():
-        return []
-    with open(p, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return [TodoItem.from_dict(d) for d in data]
+        return
+    rows, _ = _read_log(p)
+    save_items([TodoItem(*row[0]) for row in rows.values()], p)
 
 
 def save_items(items: list[TodoItem], path: Path | None = None) -> None:
-    """Atomically save all to-do items to the JSON file."""
+    """Atomically save all to-do items as a compacted log."""
     p = path or _db_path()
-    data = [item.to_dict() for item in items]
+    if is_sqlite(p):
+        storage_sqlite.save_items(items, p)
+        return
+    # Put back the snapshot an interrupted write left in .bak, so it is
+    # neither restored over this save later nor lost if this save fails.
+    _restore_backup(p)
+    data = b"".join(_encode_record({"op": "put", "item": item.to_dict()}) for item in items)
+    if _wants_gzip(p):
+        data = gzip.compress(data, compresslevel=_compress_level())
+    if len(data) < SMALL_WRITE_LIMIT and p.exists():
+        # Small snapshot: move the previous file to .bak and write in place,
+        # skipping mkstemp/fdopen. The .bak is dropped once the write
+        # completes; if it is still there, the write did not finish, and it
+        # is restored here on error, or read by loads and restored by the
+        # next write if the process died mid-write.
+        bak = _backup_path(p)
+        os.replace(p, bak)
+        try:
+            p.write_bytes(data)
+        except BaseException:
+            os.replace(bak, p)
+            raise
+        else:
+            # Another writer may have restored it already.
+            bak.unlink(missing_ok=True)
+        finally:
+            _read_log_cached.cache_clear()
+        return
     # Write to a temp file in the same directory, then rename for atomicity.
     dir_ = p.parent or Path(".")
     dir_.mkdir(parents=True, exist_ok=True)
     fd, tmp = tempfile.mkstemp(dir=str(dir_), suffix=".tmp")
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
         # On Windows, target must not exist for os.rename; use replace.
         os.replace(tmp, str(p))
     except BaseException:
         if os.path.exists(tmp):
             os.unlink(tmp)
         raise
+    finally:
+        _read_log_cached.cache_clear()
@@ -0,0 +1,140 @@
+"""SQLite persistence with indexed filtering.
+
+Selected by ``src.storage`` when the database path ends in one of
+``SUFFIXES`` and the file is new, empty or starts with ``HEADER``.
+Single-item changes are single-row statements, and ``query_items``
+evaluates the ``list`` filters in SQL instead of Python.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterator
+from contextlib import closing
+from pathlib import Path
+
+from src.models import TodoItem
+
+SUFFIXES = frozenset({".db", ".sqlite", ".sqlite3"})
+
+# First 16 bytes of every SQLite 3 database file.
+HEADER = b"SQLite format 3\x00"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id         TEXT PRIMARY KEY,
+    title      TEXT NOT NULL,
+    category   TEXT NOT NULL COLLATE NOCASE,
+    done       INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cat_done ON items(category, done);
+"""
+
+_COLUMNS = frozenset({"title", "category", "done", "created_at", "updated_at"})
+
+_SELECT = "SELECT title, category, done, id, created_at, updated_at FROM items"
+
+# Upsert rather than INSERT OR REPLACE so an updated row keeps its rowid,
+# and with it its position in insertion order.
+_UPSERT = """
+INSERT INTO items (id, title, category, done, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    title = excluded.title,
+    category = excluded.category,
+    done = excluded.done,
+    created_at = excluded.created_at,
+    updated_at = excluded.updated_at
+"""
+
+
+def _connect(p: Path) -> sqlite3.Connection:
+    p.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(p))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _row(item: TodoItem) -> tuple:
+    return (item.id, item.title, item.category, int(item.done), item.created_at, item.updated_at)
+
+
+def _item(row: tuple) -> TodoItem:
+    title, category, done, id_, created_at, updated_at = row
+    return TodoItem(title, category, bool(done), id_, created_at, updated_at)
+
+
+def iter_items(p: Path) -> Iterator[TodoItem]:
+    """Yield all to-do items in insertion order, streaming from the cursor."""
+    with closing(_connect(p)) as conn:
+        yield from map(_item, conn.execute(f"{_SELECT} ORDER BY rowid"))
+
+
+def get_item(item_id: str, p: Path) -> TodoItem | None:
+    """Return the item with *item_id* (a primary-key lookup), or None."""
+    with closing(_connect(p)) as conn:
+        row = conn.execute(f"{_SELECT} WHERE id = ?", (item_id,)).fetchone()
+    return None if row is None else _item(row)
+
+
+def query_items(
+    p: Path,
+    category: str | None = None,
+    done: bool | None = None,
+    search: str | None = None,
+) -> list[TodoItem]:
+    """Return the items matching every given filter, in insertion order.
+
+    ``category`` compares through the column's NOCASE collation so the
+    (category, done) index serves it; ``search`` is a case-insensitive
+    substring match via LIKE. Both fold ASCII case only.
+    """
+    clauses: list[str] = []
+    params: list[object] = []
+    if category:
+        clauses.append("category = ?")
+        params.append(category)
+    if done is not None:
+        clauses.append("done = ?")
+        params.append(int(done))
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("title LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    sql = _SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY rowid"
+    with closing(_connect(p)) as conn:
+        return [_item(row) for row in conn.execute(sql, params)]
+
+
+def append_item(item: TodoItem, p: Path) -> None:
+    """Insert *item*, or replace the stored row with the same id."""
+    with closing(_connect(p)) as conn, conn:
+        conn.execute(_UPSERT, _row(item))
+
+
+def save_delta(item_id: str, changes: dict, p: Path) -> None:
+    """Update only the *changes* columns of the item with *item_id*."""
+    unknown = set(changes) - _COLUMNS
+    if unknown:
+        raise ValueError(f"Unknown item fields: {sorted(unknown)}")
+    assignments = ", ".join(f"{name} = ?" for name in changes)
+    with closing(_connect(p)) as conn, conn:
+        conn.execute(f"UPDATE items SET {assignments} WHERE id = ?", (*changes.values(), item_id))
+
+
+def append_tombstone(item_id: str, p: Path) -> None:
+    """Delete the item with *item_id*."""
+    with closing(_connect(p)) as conn, conn:
+        conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+
+
+def save_items(items: list[TodoItem], p: Path) -> None:
+    """Replace the table contents with *items* in a single transaction."""
+    with closing(_connect(p)) as conn, conn:
+        conn.execute("DELETE FROM items")
+        conn.executemany(_UPSERT, map(_row, items))
@@ -1,14 +1,29 @@
 """Unit tests for the to-do app (models, storage, cli)."""
 
+import gzip
+import io
 import json
 import os
 import tempfile
 import unittest
+from contextlib import redirect_stdout
 from pathlib import Path
+from unittest import mock
 
 from src.models import TodoItem
-from src.storage import load_items, save_items
-from src.cli import main
+from src.storage import (
+    COMPACT_THRESHOLD,
+    append_item,
+    append_tombstone,
+    compact,
+    get_item,
+    iter_items,
+    load_items,
+    query_items,
+    save_delta,
+    save_items,
+)
+from src.cli import build_parser, main
 
 
 class TestTodoItem(unittest.TestCase):
@@ -19,9 +34,20 @@ class TestTodoItem(unittest.TestCase):
         self.assertEqual(item.title, "Test")
         self.assertEqual(item.category, "General")
         self.assertFalse(item.done)
-        self.assertTrue(len(item.id) == 36)  # uuid4 string length
+        self.assertTrue(len(item.id) == 16)  # 11 hex timestamp + 5 hex counter
         self.assertIn("T", item.created_at)   # ISO8601 contains T
 
+    def test_ids_unique_and_time_ordered(self):
+        ids = [TodoItem(title=str(n)).id for n in range(1000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertLessEqual(ids[0][:11], ids[-1][:11])
+
+    def test_timestamp_is_utc_iso8601(self):
+        from datetime import datetime, timedelta, timezone
+        stamp = datetime.fromisoformat(TodoItem(title="T").created_at)
+        self.assertEqual(stamp.utcoffset(), timedelta(0))
+        self.assertLess(abs(datetime.now(timezone.utc) - stamp), timedelta(seconds=5))
+
     def test_roundtrip_dict(self):
         item = TodoItem(title="RT", category="Work")
         d = item.to_dict()
@@ -30,6 +56,12 @@ class TestTodoItem(unittest.TestCase):
         self.assertEqual(item.title, restored.title)
         self.assertEqual(item.category, restored.category)
 
+    def test_slots_no_instance_dict(self):
+        item = TodoItem(title="S")
+        self.assertFalse(hasattr(item, "__dict__"))
+        with self.assertRaises(AttributeError):
+            item.colour = "red"
+
     def test_touch_updates_timestamp(self):
         item = TodoItem(title="T")
         old = item.updated_at
@@ -40,7 +72,7 @@ class TestTodoItem(unittest.TestCase):
 
 
 class TestStorage(unittest.TestCase):
-    """Tests for JSON load/save."""
+    """Tests for the JSON-Lines log: load/save, appends and compaction."""
 
     def setUp(self):
         self.tmp = tempfile.NamedTemporaryFile(
@@ -50,8 +82,9 @@ class TestStorage(unittest.TestCase):
         self.path = Path(self.tmp.name)
 
     def tearDown(self):
-        if self.path.exists():
-            self.path.unlink()
+        for p in (self.path, self.path.with_name(self.path.name + ".bak")):
+            if p.exists():
+                p.unlink()
 
     def test_load_empty_file_path(self):
         # Non-existent file returns empty list.
@@ -67,12 +100,163 @@ class TestStorage(unittest.TestCase):
         self.assertEqual(loaded[0].title, "A")
         self.assertEqual(loaded[1].category, "Work")
 
+    def test_mutating_loaded_items_does_not_leak(self):
+        save_items([TodoItem(title="A", category="Home")], self.path)
+        item = load_items(self.path)[0]
+        item.title = "MUTATED"
+        item.category = "Work"
+        item.done = True
+        again = load_items(self.path)[0]
+        self.assertEqual((again.title, again.category, again.done), ("A", "Home", False))
+        self.assertEqual(query_items(self.path, category="work"), [])
+        for it in iter_items(self.path):
+            it.title = "MUTATED"
+        self.assertEqual(get_item(item.id, self.path).title, "A")
+
+    def test_repeated_load_sees_external_writes(self):
+        save_items([TodoItem(title="A")], self.path)
+        first = load_items(self.path)
+        first.append(TodoItem(title="caller-owned"))
+        self.assertEqual(len(load_items(self.path)), 1)
+        with open(self.path, "ab") as f:
+            f.write(json.dumps({"op": "put", "item": TodoItem(title="B").to_dict()}).encode() + b"\n")
+        self.assertEqual([it.title for it in load_items(self.path)], ["A", "B"])
+
+    def test_small_rewrite_removes_backup(self):
+        save_items([TodoItem(title="Old")], self.path)
+        save_items([TodoItem(title="New")], self.path)
+        self.assertFalse(self.path.with_name(self.path.name + ".bak").exists())
+        # A database the user deleted stays deleted.
+        self.path.unlink()
+        self.assertEqual(load_items(self.path), [])
+
+    def test_interrupted_small_write_rolls_back(self):
+        save_items([TodoItem(title="Old")], self.path)
+        # Simulate a crash in save_items after the rename, mid-write.
+        bak = self.path.with_name(self.path.name + ".bak")
+        os.replace(self.path, bak)
+        self.path.write_bytes(b'{"op":"put","item":{"ti')
+        self.assertEqual([it.title for it in load_items(self.path)], ["Old"])
+        # Loads only read the .bak; the next write restores it.
+        self.assertTrue(bak.exists())
+        append_item(TodoItem(title="New"), self.path)
+        self.assertEqual([it.title for it in load_items(self.path)], ["Old", "New"])
+        self.assertFalse(bak.exists())
+
+    def test_save_after_interrupted_write_is_not_reverted(self):
+        save_items([TodoItem(title="Old")], self.path)
+        # Crash right after the rename: only the .bak is left.
+        bak = self.path.with_name(self.path.name + ".bak")
+        os.replace(self.path, bak)
+        save_items([TodoItem(title="New")], self.path)
+        self.assertFalse(bak.exists())
+        self.assertEqual([it.title for it in load_items(self.path)], ["New"])
+
+    def test_compact_after_interrupted_write_keeps_backup(self):
+        save_items([TodoItem(title="Old")], self.path)
+        bak = self.path.with_name(self.path.name + ".bak")
+        os.replace(self.path, bak)
+        self.path.write_bytes(b'{"op":"put","item":{"ti')
+        compact(self.path)
+        self.assertFalse(bak.exists())
+        self.assertEqual([it.title for it in load_items(self.path)], ["Old"])
+
+    def test_get_item_returns_copy(self):
+        item = TodoItem(title="A")
+        save_items([item, TodoItem(title="B")], self.path)
+        got = get_item(item.id, self.path)
+        self.assertEqual(got, item)
+        got.title = "changed"
+        self.assertEqual(get_item(item.id, self.path).title, "A")
+        self.assertIsNone(get_item("missing", self.path))
+
+    def test_iter_items_in_order(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.path)
+        append_tombstone(a.id, self.path)
+        append_item(TodoItem(title="C"), self.path)
+        it = iter_items(self.path)
+        self.assertNotIsInstance(it, list)
+        self.assertEqual([x.title for x in it], ["B", "C"])
+
     def test_atomic_write_valid_json(self):
         save_items([TodoItem(title="X")], self.path)
         with open(self.path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        self.assertIsInstance(data, list)
-        self.assertEqual(len(data), 1)
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["op"], "put")
+        self.assertEqual(records[0]["item"]["title"], "X")
+
+    def test_append_keeps_existing_bytes(self):
+        save_items([TodoItem(title="A")], self.path)
+        before = self.path.read_bytes()
+        append_item(TodoItem(title="B"), self.path)
+        self.assertTrue(self.path.read_bytes().startswith(before))
+        self.assertEqual([it.title for it in load_items(self.path)], ["A", "B"])
+
+    def test_append_revision_replaces_in_place(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.path)
+        a.title = "A2"
+        append_item(a, self.path)
+        self.assertEqual([it.title for it in load_items(self.path)], ["A2", "B"])
+
+    def test_tombstone_removes_item(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.path)
+        append_tombstone(a.id, self.path)
+        self.assertEqual([it.id for it in load_items(self.path)], [b.id])
+
+    def test_delta_replays_over_base(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.path)
+        save_delta(a.id, {"category": "Work", "done": True}, self.path)
+        loaded = get_item(a.id, self.path)
+        self.assertEqual((loaded.title, loaded.category, loaded.done), ("A", "Work", True))
+        self.assertEqual([it.id for it in query_items(self.path, category="work")], [a.id])
+
+    def test_torn_append_is_ignored_and_repaired(self):
+        a = TodoItem(title="A")
+        save_items([a], self.path)
+        with open(self.path, "ab") as f:
+            f.write(b'{"op":"put","item":{"title":"Tor')
+        self.assertEqual([it.id for it in load_items(self.path)], [a.id])
+        b = TodoItem(title="B")
+        append_item(b, self.path)
+        self.assertEqual([it.title for it in load_items(self.path)], ["A", "B"])
+        with open(self.path, "rb") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_legacy_array_migrates_on_append(self):
+        legacy = TodoItem(title="Old")
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump([legacy.to_dict()], f, indent=2)
+        self.assertEqual(load_items(self.path)[0].id, legacy.id)
+        append_item(TodoItem(title="New"), self.path)
+        self.assertEqual([it.title for it in load_items(self.path)], ["Old", "New"])
+
+    def test_load_compacts_stale_records(self):
+        item = TodoItem(title="Churn")
+        save_items([item], self.path)
+        for _ in range(COMPACT_THRESHOLD + 1):
+            append_item(item, self.path)
+        self.assertEqual(len(load_items(self.path)), 1)
+        with open(self.path, "rb") as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+class TestParser(unittest.TestCase):
+    """Tests for the shared argument parser."""
+
+    def test_parser_reused_across_calls(self):
+        self.assertIs(build_parser(), build_parser())
+
+    def test_reused_parser_does_not_leak_arguments(self):
+        parser = build_parser()
+        first = parser.parse_args(["update", "x", "--title", "T"])
+        second = parser.parse_args(["update", "y"])
+        self.assertEqual(first.title, "T")
+        self.assertIsNone(second.title)
 
 
 class TestCLIAdd(unittest.TestCase):
@@ -89,8 +273,9 @@ class TestCLIAdd(unittest.TestCase):
             json.dump([], f)
 
     def tearDown(self):
-        if self.db.exists():
-            self.db.unlink()
+        for p in (self.db, self.db.with_name(self.db.name + ".bak")):
+            if p.exists():
+                p.unlink()
 
     def test_add_default_category(self):
         rc = main(["add", "Buy milk"], db=self.db)
@@ -129,6 +314,13 @@ class TestCLIUpdate(unittest.TestCase):
         items = load_items(self.db)
         self.assertTrue(items[0].done)
 
+    def test_update_appends_only_changed_fields(self):
+        main(["update", self.item.id, "--done", "true"], db=self.db)
+        with open(self.db, "r", encoding="utf-8") as f:
+            last = json.loads(f.readlines()[-1])
+        self.assertEqual(last["op"], "upd")
+        self.assertEqual(set(last["changes"]), {"done", "updated_at"})
+
     def test_update_missing_id(self):
         rc = main(["update", "nonexistent-id", "--title", "X"], db=self.db)
         self.assertEqual(rc, 1)
@@ -176,6 +368,18 @@ class TestCLIList(unittest.TestCase):
         rc = main(["list"], db=self.db)
         self.assertEqual(rc, 0)
 
+    def test_list_table_alignment(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main(["list"], db=self.db)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)  # header, rule, three rows
+        self.assertTrue(lines[0].startswith("ID"))
+        # Every line puts the Category column at the same offset.
+        col = lines[0].index("Category")
+        self.assertEqual(lines[2][col:col + 8], "Shopping")
+        self.assertEqual(lines[3][col:col + 4], "Work")
+
     def test_list_filter_category(self):
         # Should not error; output tested implicitly.
         rc = main(["list", "--category", "Shopping"], db=self.db)
@@ -210,6 +414,182 @@ class TestCLICategories(unittest.TestCase):
         rc = main(["categories"], db=self.db)
         self.assertEqual(rc, 0)
 
+    def test_categories_counts_sorted_by_name(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main(["categories"], db=self.db)
+        self.assertEqual(
+            [line.split() for line in out.getvalue().splitlines()],
+            [["Home", "1"], ["Work", "2"]],
+        )
+
+
+class TestCompressedStorage(unittest.TestCase):
+    """Tests for the gzip-compressed log selected by a .gz suffix."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = Path(tmp.name) / "todo.json.gz"
+
+    def test_save_writes_gzip(self):
+        items = [TodoItem(title=f"Item {n}", category="Bulk") for n in range(50)]
+        save_items(items, self.db)
+        self.assertEqual(self.db.read_bytes()[:2], b"\x1f\x8b")
+        self.assertEqual(load_items(self.db), items)
+
+    def test_appends_and_deltas(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a], self.db)
+        append_item(b, self.db)
+        save_delta(b.id, {"done": True}, self.db)
+        append_tombstone(a.id, self.db)
+        loaded = load_items(self.db)
+        self.assertEqual([it.id for it in loaded], [b.id])
+        self.assertTrue(loaded[0].done)
+
+    def test_torn_member_is_ignored_and_repaired(self):
+        a = TodoItem(title="A")
+        save_items([a], self.db)
+        append_item(TodoItem(title="B"), self.db)
+        # An append cut inside the deflate data, then one cut inside the magic.
+        for cut in (14, 1):
+            good = self.db.read_bytes()
+            torn = gzip.compress(b'{"op":"del","id":"0000000000000000"}\n')[:cut]
+            self.db.write_bytes(good + torn)
+            self.assertEqual([it.title for it in load_items(self.db)], ["A", "B"])
+            append_item(TodoItem(title="C"), self.db)
+            self.assertEqual([it.title for it in load_items(self.db)], ["A", "B", "C"])
+            append_tombstone(load_items(self.db)[-1].id, self.db)
+
+    def test_plain_json_under_gz_name_migrates(self):
+        legacy = TodoItem(title="Old")
+        self.db.write_text(json.dumps([legacy.to_dict()], indent=2), encoding="utf-8")
+        self.assertEqual(load_items(self.db)[0].id, legacy.id)
+        main(["add", "New"], db=self.db)
+        self.assertEqual(self.db.read_bytes()[:2], b"\x1f\x8b")
+        self.assertEqual([it.title for it in load_items(self.db)], ["Old", "New"])
+
+    def test_compress_level_out_of_range_is_clamped(self):
+        with mock.patch.dict(os.environ, {"TODO_COMPRESS_LEVEL": "19"}):
+            save_items([TodoItem(title="Max")], self.db)
+            append_item(TodoItem(title="More"), self.db)
+        self.assertEqual([it.title for it in load_items(self.db)], ["Max", "More"])
+
+    def test_compress_level_not_a_number(self):
+        with mock.patch.dict(os.environ, {"TODO_COMPRESS_LEVEL": "fast"}):
+            with self.assertRaisesRegex(ValueError, "TODO_COMPRESS_LEVEL"):
+                save_items([TodoItem(title="X")], self.db)
+
+    def test_cli_roundtrip(self):
+        main(["add", "Zip it"], db=self.db)
+        self.assertEqual(load_items(self.db)[0].title, "Zip it")
+
+
+class TestQueryItems(unittest.TestCase):
+    """Tests for list filtering, on both the log and SQLite backends."""
+
+    suffix = ".json"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = Path(tmp.name) / f"todo{self.suffix}"
+        self.items = [
+            TodoItem(title="Buy milk", category="Shopping", done=False),
+            TodoItem(title="Write report", category="Work", done=True),
+            TodoItem(title="Buy 100% juice", category="shopping", done=True),
+        ]
+        save_items(self.items, self.db)
+
+    def titles(self, **filters):
+        return [it.title for it in query_items(self.db, **filters)]
+
+    def test_no_filters(self):
+        self.assertEqual(self.titles(), [it.title for it in self.items])
+
+    def test_category_case_insensitive(self):
+        self.assertEqual(self.titles(category="SHOPPING"), ["Buy milk", "Buy 100% juice"])
+
+    def test_done(self):
+        self.assertEqual(self.titles(done=False), ["Buy milk"])
+
+    def test_search_substring(self):
+        self.assertEqual(self.titles(search="BUY"), ["Buy milk", "Buy 100% juice"])
+        self.assertEqual(self.titles(search="0%"), ["Buy 100% juice"])
+
+    def test_combined(self):
+        self.assertEqual(
+            self.titles(category="shopping", done=True, search="juice"),
+            ["Buy 100% juice"],
+        )
+
+    def test_filters_see_updated_fields(self):
+        save_delta(self.items[0].id, {"title": "Sell MILK", "category": "Home"}, self.db)
+        self.assertEqual(self.titles(category="home", search="milk"), ["Sell MILK"])
+        self.assertEqual(self.titles(category="shopping"), ["Buy 100% juice"])
+
+
+class TestSQLiteQueryItems(TestQueryItems):
+    """The same filters, evaluated by the SQLite backend."""
+
+    suffix = ".sqlite"
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """Tests for the SQLite backend selected by the database suffix."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.db = self.dir / "todo.sqlite"
+
+    def test_save_and_load(self):
+        items = [TodoItem(title="A"), TodoItem(title="B", category="Work", done=True)]
+        save_items(items, self.db)
+        self.assertEqual(load_items(self.db), items)
+
+    def test_get_item_by_primary_key(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.db)
+        self.assertEqual(get_item(b.id, self.db), b)
+        self.assertIsNone(get_item("missing", self.db))
+
+    def test_iter_items_streams_rows(self):
+        items = [TodoItem(title="A"), TodoItem(title="B")]
+        save_items(items, self.db)
+        self.assertEqual(list(iter_items(self.db)), items)
+
+    def test_update_keeps_position(self):
+        a, b = TodoItem(title="A"), TodoItem(title="B")
+        save_items([a, b], self.db)
+        a.title = "A2"
+        append_item(a, self.db)
+        self.assertEqual([it.title for it in load_items(self.db)], ["A2", "B"])
+
+    def test_existing_json_db_file_stays_on_log_backend(self):
+        db = self.dir / "todos.db"
+        legacy = TodoItem(title="Old")
+        db.write_text(json.dumps([legacy.to_dict()], indent=2), encoding="utf-8")
+        main(["add", "New"], db=db)
+        self.assertEqual([it.title for it in load_items(db)], ["Old", "New"])
+        self.assertNotEqual(db.read_bytes()[:6], b"SQLite")
+
+    def test_new_db_file_uses_sqlite(self):
+        db = self.dir / "todos.db"
+        main(["add", "Fresh"], db=db)
+        self.assertTrue(db.read_bytes().startswith(b"SQLite format 3\x00"))
+        self.assertEqual(load_items(db)[0].title, "Fresh")
+
+    def test_cli_roundtrip(self):
+        main(["add", "Ship it", "--category", "Work"], db=self.db)
+        item = load_items(self.db)[0]
+        main(["update", item.id, "--done", "true"], db=self.db)
+        self.assertTrue(get_item(item.id, self.db).done)
+        self.assertEqual(main(["delete", item.id], db=self.db), 0)
+        self.assertEqual(load_items(self.db), [])
+
 
 if __name__ == "__main__":
     unittest.main()